@@ -3,10 +3,12 @@ from typing import List
 
 from app.models.schemas import (
     GraphLoadRequest, VehicleIn, DeliveryIn, EventIn,
-    InitialRouteResponse, AdaptiveRouteResponse, ResilienceScoreResponse
+    InitialRouteResponse, AdaptiveRouteResponse, TimeWindowRouteResponse,
+    ResilienceScoreResponse
 )
 from app.services.graph import GraphService
 from app.services.vrp import VRPService
+from app.services.vrptw import VRPTWService
 from app.services.adaptive import AdaptiveService
 from app.services.resilience import ResilienceService
 from app.store.state import db
@@ -15,6 +17,7 @@ router = APIRouter()
 
 graph_service = GraphService(db)
 vrp_service = VRPService(db)
+vrptw_service = VRPTWService(db)
 adaptive_service = AdaptiveService(db)
 resilience_service = ResilienceService(db)
 
@@ -43,6 +46,19 @@ def initial_route():
     db.routes = routes
     return InitialRouteResponse(routes=routes, total_cost=cost)
 
+@router.post("/route/timewindow", response_model=TimeWindowRouteResponse)
+def timewindow_route():
+    if db.G is None:
+        raise HTTPException(400, "Graph not loaded")
+    if not db.vehicles or not db.deliveries:
+        raise HTTPException(400, "Vehicles and deliveries required")
+    missing = [v.id for v in db.vehicles.values() if v.start_node not in db.G]
+    if missing:
+        raise HTTPException(400, f"Vehicle start node not in graph: {', '.join(missing)}")
+    routes, cost, unassigned, details = vrptw_service.plan()
+    db.routes = routes
+    return TimeWindowRouteResponse(routes=routes, total_cost=cost, details=details, unassigned=unassigned)
+
 @router.post("/events")
 def post_event(event: EventIn):
     adaptive_service.ingest_event(event)
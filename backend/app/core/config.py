@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 import os
 
 
@@ -12,6 +12,18 @@ class Settings(BaseModel):
     RL_ALPHA: float = float(os.getenv("RL_ALPHA", 0.1))
     RL_GAMMA: float = float(os.getenv("RL_GAMMA", 0.9))
     RL_EPSILON: float = float(os.getenv("RL_EPSILON", 0.2))
+    TW_SPEED: float = float(os.getenv("TW_SPEED", 1.0))
+    TW_SERVICE_TIME: float = float(os.getenv("TW_SERVICE_TIME", 0.0))
+    TW_FUEL_PER_DISTANCE: float = float(os.getenv("TW_FUEL_PER_DISTANCE", 1.0))
+    TW_RELOCATE_PASSES: int = int(os.getenv("TW_RELOCATE_PASSES", 2))
+    TW_NEIGHBOURS: int = int(os.getenv("TW_NEIGHBOURS", 10))
+    TW_WIDE_NEIGHBOURS: int = int(os.getenv("TW_WIDE_NEIGHBOURS", 80))
+
+    @model_validator(mode="after")
+    def _check_speed(self):
+        if self.TW_SPEED <= 0:
+            raise ValueError("TW_SPEED must be greater than 0")
+        return self
 
 
 settings = Settings()
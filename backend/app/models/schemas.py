@@ -36,5 +36,9 @@ class AdaptiveRouteResponse(InitialRouteResponse):
     details: Dict[str, Dict]
 
 
+class TimeWindowRouteResponse(AdaptiveRouteResponse):
+    unassigned: List[str]  # deliveries no vehicle can serve within deadline/fuel/load
+
+
 class ResilienceScoreResponse(BaseModel):
     score: float
@@ -0,0 +1,356 @@
+import heapq
+from array import array
+from typing import Dict, List
+import networkx as nx
+from pydantic import ValidationError
+from app.core.config import settings
+from app.models.schemas import DeliveryIn
+
+INF = float('inf')
+EPS = 1e-9
+
+
+class _Route:
+    """Open route of one vehicle with cached prefix/suffix resource values.
+
+    Position 0 is the vehicle start; positions 1..m are delivery stops.
+    `arr[k]` is the arrival time, `dist[k]` the distance driven so far and
+    `slack[k]` the forward time slack: how far arrival at k may be pushed
+    back before some stop k..m misses its deadline. With these cached, an
+    insertion or removal is checked in O(1) instead of re-simulating.
+    """
+
+    def __init__(self, vid: str, start: int, load_cap: float, fuel_cap: float):
+        self.vid = vid
+        self.nodes: List[int] = [start]
+        self.jobs: List[str | None] = [None]
+        self.late: List[float] = [INF]
+        self.arr: List[float] = [0.0]
+        self.dist: List[float] = [0.0]
+        self.slack: List[float] = [INF]
+        self.pos: Dict[int, List[int]] = {start: [0]}
+        self.load = 0.0
+        self.load_cap = load_cap
+        self.fuel_cap = fuel_cap
+
+    def refresh(self, dist_fn, speed: float, service: float):
+        nodes = self.nodes
+        m = len(nodes)
+        arr = [0.0] * m
+        dist = [0.0] * m
+        pos: Dict[int, List[int]] = {nodes[0]: [0]}
+        for k in range(1, m):
+            d = dist_fn(nodes[k - 1], nodes[k])
+            dist[k] = dist[k - 1] + d
+            arr[k] = arr[k - 1] + (service if k > 1 else 0.0) + d / speed
+            pos.setdefault(nodes[k], []).append(k)
+        slack = [INF] * m
+        s = INF
+        for k in range(m - 1, -1, -1):
+            s = min(s, self.late[k] - arr[k])
+            slack[k] = s
+        self.arr, self.dist, self.slack, self.pos = arr, dist, slack, pos
+
+
+class _Plan:
+    """Scratch state of one `VRPTWService.plan()` call.
+
+    Shortest-path distances are never computed all-pairs. A delivery node
+    gets a Dijkstra search that stops once enough routed stops are settled;
+    only settled distances and predecessors are cached. Any other leg a move
+    needs is fetched lazily and cached as well.
+    """
+
+    def __init__(self, G: nx.Graph, vehicles: dict, cutoff: float | None):
+        self.G = G
+        self.cutoff = cutoff
+        self.speed = settings.TW_SPEED
+        self.service = settings.TW_SERVICE_TIME
+        self.fuel_rate = settings.TW_FUEL_PER_DISTANCE
+        self.K = settings.TW_NEIGHBOURS
+        self.targets: set[int] = {v.start_node for v in vehicles.values()}
+        self.D: Dict[int, Dict[int, float]] = {}
+        self.pred: Dict[int, Dict[int, int]] = {}
+        self.paths: Dict[tuple[int, int], List[int]] = {}
+        self.near: Dict[int, List[int]] = {}
+        self.sorted_adj: Dict[int, tuple[array, List[int]]] = {}
+        self.searched_at: Dict[int, tuple[int, int]] = {}
+        self.exhausted: set[int] = set()
+        self.version = 0
+        self.routes = [_Route(vid, v.start_node, v.load_capacity, v.fuel_capacity)
+                       for vid, v in vehicles.items()]
+        self.where: Dict[int, List[_Route]] = {}
+        for r in self.routes:
+            self.where.setdefault(r.nodes[0], []).append(r)
+
+    # -- distances ---------------------------------------------------------
+
+    def dist(self, a: int, b: int) -> float | None:
+        """Cached shortest distance (graph is undirected), or None."""
+        if a == b:
+            return 0.0
+        d = self.D.get(a, {}).get(b)
+        if d is None:
+            d = self.D.get(b, {}).get(a)
+        return d
+
+    def leg(self, a: int, b: int) -> float:
+        d = self.dist(a, b)
+        if d is None:
+            d, path = nx.bidirectional_dijkstra(self.G, a, b, weight='weight')
+            self.D.setdefault(a, {})[b] = d
+            self.paths[(a, b)] = path
+        return d
+
+    def _edges(self, x: int) -> tuple[array, List[int]]:
+        """Edges of x sorted by weight, as (weights, neighbours); kept as a
+        float array plus references to the graph's own node keys so caching
+        them on a dense graph stays cheap."""
+        out = self.sorted_adj.get(x)
+        if out is None:
+            pairs = sorted((e['weight'], y) for y, e in self.G._adj[x].items())
+            out = (array('d', [w for w, _ in pairs]), [y for _, y in pairs])
+            self.sorted_adj[x] = out
+        return out
+
+    def _search(self, u: int, K: int):
+        """Dijkstra from u, stopping after K routed stops are settled, or one
+        routed stop and 4*K relevant nodes (keeps early searches short).
+
+        Edges are expanded lazily in weight order: the heap holds only the
+        next unexplored edge of each settled node, so on dense graphs the
+        work is bounded by the edges inside the final search radius rather
+        than by every edge of every settled node."""
+        width = 4 * K
+        limit = INF if self.cutoff is None else self.cutoff + EPS
+        targets, where, edges = self.targets, self.where, self._edges
+        Du = self.D.setdefault(u, {})
+        pred = self.pred.setdefault(u, {})
+        settled: Dict[int, float] = {}
+        order: List[int] = []
+        routed = 0
+        # (tentative distance, node, via, index of the edge of `via` used)
+        pq = [(0.0, u, u, -1)]
+        push, pop = heapq.heappush, heapq.heappop
+        while pq:
+            d, x, via, i = pop(pq)
+            if i >= 0:
+                ws, ys = edges(via)
+                if i + 1 < len(ys):
+                    nd = settled[via] + ws[i + 1]
+                    if nd <= limit:
+                        push(pq, (nd, ys[i + 1], via, i + 1))
+            if x in settled:
+                continue
+            settled[x] = d
+            pred[x] = via
+            if x in targets:
+                Du[x] = d
+                order.append(x)
+                if where.get(x):
+                    routed += 1
+                    if routed >= K or len(order) >= width:
+                        break
+            ws, ys = edges(x)
+            if ys and d + ws[0] <= limit:
+                push(pq, (d + ws[0], ys[0], x, 0))
+        else:
+            self.exhausted.add(u)
+        self.near[u] = order
+        self.searched_at[u] = (self.version, K)
+
+    def neighbours(self, u: int, K: int) -> List[int]:
+        """Up to K routed nodes nearest to u, nearest first."""
+        if u not in self.near:
+            self._search(u, K)
+        found = [x for x in self.near[u] if self.where.get(x)]
+        if (len(found) < K and u not in self.exhausted
+                and self.searched_at[u] != (self.version, K)):
+            self._search(u, K)
+            found = [x for x in self.near[u] if self.where.get(x)]
+        return found[:K]
+
+    def path(self, a: int, b: int) -> List[int]:
+        if (a, b) in self.paths:
+            return self.paths[(a, b)]
+        if (b, a) in self.paths:
+            return self.paths[(b, a)][::-1]
+        pa, pb = self.pred.get(a, {}), self.pred.get(b, {})
+        if b in pa:
+            out = [b]
+            while out[-1] != a:
+                out.append(pa[out[-1]])
+            return out[::-1]
+        if a in pb:
+            out = [a]
+            while out[-1] != b:
+                out.append(pb[out[-1]])
+            return out
+        return nx.shortest_path(self.G, a, b, weight='weight')
+
+    # -- moves -------------------------------------------------------------
+
+    def best_insertion(self, d: DeliveryIn, skip: _Route | None = None, K: int = 0):
+        u, demand = d.node, d.demand
+        K = K or self.K
+        late = d.deadline if d.deadline is not None else INF
+        speed, service = self.speed, self.service
+        cands = {}
+        for x in self.neighbours(u, K):
+            for r in dict.fromkeys(self.where[x]):
+                if r is skip or r.load + demand > r.load_cap + EPS:
+                    continue
+                for p in r.pos[x]:
+                    cands[(r, p)] = None
+                    if p > 0:
+                        cands[(r, p - 1)] = None
+        best = None
+        for r, k in cands:
+            nodes = r.nodes
+            d_in = self.dist(nodes[k], u)
+            if d_in is None:
+                continue
+            a_u = r.arr[k] + (service if k > 0 else 0.0) + d_in / speed
+            if a_u > late + EPS:
+                continue
+            if k + 1 < len(nodes):
+                d_out = self.dist(u, nodes[k + 1])
+                if d_out is None:
+                    continue
+                delta = d_in + d_out - (r.dist[k + 1] - r.dist[k])
+                if delta / speed + service > r.slack[k + 1] + EPS:
+                    continue
+            else:
+                delta = d_in
+            if (r.dist[-1] + delta) * self.fuel_rate > r.fuel_cap + EPS:
+                continue
+            if best is None or delta < best[0]:
+                best = (delta, r, k + 1)
+        return best
+
+    def insert(self, r: _Route, pos: int, d: DeliveryIn):
+        r.nodes.insert(pos, d.node)
+        r.jobs.insert(pos, d.id)
+        r.late.insert(pos, d.deadline if d.deadline is not None else INF)
+        r.load += d.demand
+        r.refresh(self.leg, self.speed, self.service)
+        self.where.setdefault(d.node, []).append(r)
+        self.version += 1
+
+    def remove(self, r: _Route, pos: int, d: DeliveryIn):
+        del r.nodes[pos], r.jobs[pos], r.late[pos]
+        r.load -= d.demand
+        r.refresh(self.leg, self.speed, self.service)
+        self.where[d.node].remove(r)
+        self.version += 1
+
+    def relocate(self, jobs: Dict[str, DeliveryIn]) -> bool:
+        """One pass of inter-route relocate. Removing a stop never delays the
+        rest of its route (shortest-path distances obey the triangle
+        inequality), so only the insertion side needs the slack check."""
+        improved = False
+        for r in self.routes:
+            pos = 1
+            while pos < len(r.nodes):
+                d = jobs[r.jobs[pos]]
+                best = self.best_insertion(d, skip=r)
+                # removal saves at most the two legs around the stop
+                last = pos + 1 == len(r.nodes)
+                bound = (r.dist[-1] if last else r.dist[pos + 1]) - r.dist[pos - 1]
+                if best is not None and best[0] < bound - EPS:
+                    gain = bound
+                    if not last:
+                        gain -= self.leg(r.nodes[pos - 1], r.nodes[pos + 1])
+                    if best[0] < gain - EPS:
+                        _, target, tpos = best
+                        self.remove(r, pos, d)
+                        self.insert(target, tpos, d)
+                        improved = True
+                        continue
+                pos += 1
+        return improved
+
+
+class VRPTWService:
+    """Deadline- and fuel-aware routing (VRP with time windows).
+
+    Travel time along an edge is its `weight` divided by `TW_SPEED`; fuel burn
+    is `weight * TW_FUEL_PER_DISTANCE` and must stay within the vehicle's
+    `fuel_capacity`. `DeliveryIn.deadline` is the latest allowed arrival.
+    Deliveries are inserted earliest-deadline-first at their cheapest feasible
+    position, then improved by inter-route relocate moves. Only positions next
+    to the `TW_NEIGHBOURS` nearest routed stops are tried (a granular
+    neighbourhood); a delivery that fits none of them gets one retry with
+    `TW_WIDE_NEIGHBOURS` before it is reported unassigned.
+    """
+
+    def __init__(self, _db):
+        self.db = _db
+
+    def _deliveries(self) -> tuple[List[DeliveryIn], List[str]]:
+        # `new_order` events store raw dicts; normalise them here
+        ok, bad = [], []
+        for key, d in self.db.deliveries.items():
+            if isinstance(d, DeliveryIn):
+                ok.append(d)
+                continue
+            try:
+                ok.append(DeliveryIn(**d))
+            except (TypeError, ValidationError):
+                bad.append(key)
+        return ok, bad
+
+    def plan(self) -> tuple[Dict[str, List[int]], float, List[str], Dict]:
+        G: nx.Graph = self.db.G
+        vehicles = self.db.vehicles
+        deliveries, unassigned = self._deliveries()
+        jobs = {d.id: d for d in deliveries}
+
+        # nothing beyond the largest fuel range can ever be driven
+        fuel_rate = settings.TW_FUEL_PER_DISTANCE
+        cutoff = None
+        if fuel_rate > 0 and vehicles:
+            cutoff = max(v.fuel_capacity for v in vehicles.values()) / fuel_rate
+        # ...nor, when every stop has a deadline, beyond the latest one
+        if deliveries and all(d.deadline is not None for d in deliveries):
+            horizon = max(d.deadline for d in deliveries) * settings.TW_SPEED
+            cutoff = horizon if cutoff is None else min(cutoff, horizon)
+
+        ctx = _Plan(G, vehicles, cutoff)
+        ctx.targets |= {d.node for d in deliveries}
+
+        # earliest deadline first; bigger demands first among equal deadlines
+        order = sorted(deliveries, key=lambda d: (
+            d.deadline if d.deadline is not None else INF, -d.demand))
+        for d in order:
+            best = None
+            if d.node in G:
+                # widen the neighbourhood before giving up on a delivery
+                best = (ctx.best_insertion(d)
+                        or ctx.best_insertion(d, K=settings.TW_WIDE_NEIGHBOURS))
+            if best is None:
+                unassigned.append(d.id)
+                continue
+            _, r, pos = best
+            ctx.insert(r, pos, d)
+
+        for _ in range(settings.TW_RELOCATE_PASSES):
+            if not ctx.relocate(jobs):
+                break
+
+        # expand stop sequences into node paths, one shortest path per leg
+        out: Dict[str, List[int]] = {}
+        details = {"stops": {}}
+        total_cost = 0.0
+        for r in ctx.routes:
+            path = [r.nodes[0]]
+            for u, v in zip(r.nodes[:-1], r.nodes[1:]):
+                if u != v:
+                    path += ctx.path(u, v)[1:]
+            out[r.vid] = path
+            total_cost += r.dist[-1]
+            details["stops"][r.vid] = [
+                {"delivery": r.jobs[k], "node": r.nodes[k], "arrival": r.arr[k]}
+                for k in range(1, len(r.nodes))
+            ]
+        return out, total_cost, unassigned, details
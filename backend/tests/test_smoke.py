@@ -1,5 +1,19 @@
+import random
+import time
+
+import networkx as nx
+import pytest
 from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
 from app.main import app
+from app.core.config import Settings, settings
+from app.models.schemas import (
+    DeliveryIn, GraphLoadRequest, TimeWindowRouteResponse, VehicleIn
+)
+from app.services.graph import GraphService
+from app.services.vrptw import VRPTWService
+from app.store.state import DBState
 
 client = TestClient(app)
 
@@ -34,3 +48,115 @@ def test_smoke():
 
     rs = client.get("/score/resilience")
     assert rs.status_code == 200
+
+
+def _tw_db(deliveries, fuel=100.0):
+    # 4 -1- 0 -1- 1 -1- 2, vehicle starts at 0
+    G = nx.Graph()
+    G.add_weighted_edges_from([(4, 0, 1.0), (0, 1, 1.0), (1, 2, 1.0)])
+    return DBState(
+        G=G,
+        vehicles={"v1": VehicleIn(id="v1", start_node=0, fuel_capacity=fuel)},
+        deliveries={d["id"]: DeliveryIn(**d) for d in deliveries},
+    )
+
+
+def test_timewindow_slack_forces_order():
+    # B before A would be cheaper (+2 vs +3) but pushes A past its deadline
+    db = _tw_db([{"id": "A", "node": 2, "deadline": 2.0}, {"id": "B", "node": 4}])
+    routes, cost, unassigned, details = VRPTWService(db).plan()
+    stops = details["stops"]["v1"]
+    assert [s["delivery"] for s in stops] == ["A", "B"]
+    assert routes["v1"] == [0, 1, 2, 1, 0, 4]
+    assert cost == 5.0 and unassigned == []
+
+
+def test_timewindow_slack_rejects_delivery():
+    db = _tw_db([{"id": "A", "node": 2, "deadline": 2.0},
+                 {"id": "B", "node": 4, "deadline": 4.0}])
+    routes, cost, unassigned, details = VRPTWService(db).plan()
+    assert unassigned == ["B"]
+    assert [s["delivery"] for s in details["stops"]["v1"]] == ["A"]
+
+
+def test_timewindow_fuel_cap():
+    jobs = [{"id": "A", "node": 2, "demand": 2.0}, {"id": "B", "node": 4}]
+    routes, cost, unassigned, details = VRPTWService(_tw_db(jobs)).plan()
+    assert unassigned == [] and cost == 4.0
+
+    # 0 -> 4 -> 2 needs 4 units; with 3 only A fits
+    routes, cost, unassigned, details = VRPTWService(_tw_db(jobs, fuel=3.0)).plan()
+    assert unassigned == ["B"]
+    assert routes["v1"] == [0, 1, 2]
+
+
+def test_timewindow_arrivals(monkeypatch):
+    monkeypatch.setattr(settings, "TW_SPEED", 2.0)
+    db = _tw_db([{"id": "A", "node": 1, "deadline": 0.5}, {"id": "B", "node": 2}])
+    routes, cost, unassigned, details = VRPTWService(db).plan()
+    assert [(s["delivery"], s["arrival"]) for s in details["stops"]["v1"]] == [
+        ("A", 0.5), ("B", 1.0)]
+
+
+def test_timewindow_unknown_start_node():
+    assert client.post("/graph/load", json={"mode": "synthetic", "n_nodes": 30}).status_code == 200
+    vehicles = [{"id": "v1", "start_node": 999}]
+    deliveries = [{"id": "d1", "node": 5}]
+    assert client.post("/vehicles", json=vehicles).status_code == 200
+    assert client.post("/deliveries", json=deliveries).status_code == 200
+    assert client.post("/route/timewindow").status_code == 400
+
+
+def test_timewindow_route():
+    assert client.post("/graph/load", json={"mode": "synthetic", "n_nodes": 30}).status_code == 200
+    vehicles = [
+        {"id": "v1", "start_node": 0, "fuel_capacity": 100, "load_capacity": 10},
+        {"id": "v2", "start_node": 1, "fuel_capacity": 100, "load_capacity": 10},
+    ]
+    deliveries = [
+        {"id": "d1", "node": 5, "demand": 2, "deadline": 5},
+        {"id": "d2", "node": 10, "demand": 2},
+        {"id": "d3", "node": 15, "demand": 2},
+    ]
+    assert client.post("/vehicles", json=vehicles).status_code == 200
+    assert client.post("/deliveries", json=deliveries).status_code == 200
+    # malformed order from an event is reported, not a 500
+    ev = {"type": "new_order", "payload": {"id": "bad", "node": "nowhere"}}
+    assert client.post("/events", json=ev).status_code == 200
+
+    r = client.post("/route/timewindow")
+    assert r.status_code == 200
+    data = TimeWindowRouteResponse.model_validate(r.json())
+    assert data.unassigned == ["bad"]
+    served = sorted(s["delivery"] for stops in data.details["stops"].values() for s in stops)
+    assert served == ["d1", "d2", "d3"]
+    for vid, stops in data.details["stops"].items():
+        if stops:
+            assert data.routes[vid][-1] == stops[-1]["node"]
+
+
+def test_tw_speed_must_be_positive():
+    with pytest.raises(ValidationError):
+        Settings(TW_SPEED=0)
+
+
+def test_timewindow_scale():
+    # thousands of deliveries on a dense synthetic graph
+    db = DBState()
+    GraphService(db).load_graph(GraphLoadRequest(n_nodes=1000, seed=7))
+    rng = random.Random(7)
+    nodes = list(db.G)
+    db.vehicles = {f"v{i}": VehicleIn(id=f"v{i}", start_node=rng.choice(nodes), load_capacity=1e9)
+                   for i in range(20)}
+    db.deliveries = {f"d{i}": DeliveryIn(id=f"d{i}", node=rng.choice(nodes),
+                                         deadline=rng.choice([None, rng.uniform(0.5, 5)]))
+                     for i in range(2000)}
+
+    t0 = time.perf_counter()
+    routes, cost, unassigned, details = VRPTWService(db).plan()
+    assert time.perf_counter() - t0 < 15.0
+    assert len(unassigned) < 100
+    for stops in details["stops"].values():
+        for s in stops:
+            deadline = db.deliveries[s["delivery"]].deadline
+            assert deadline is None or s["arrival"] <= deadline + 1e-9